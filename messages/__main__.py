@@ -1,11 +1,10 @@
 """Entry point into the Messages application.
+
+Parses arguments before importing anything heavy, so short runs such as
+--help start quickly.
 """
 
 import argparse
-from functools import partial
-
-from .archive import Archive
-from .messages import Messages
 
 def main():
   """Runs the Messages CLI main loop.
@@ -13,15 +12,24 @@ def main():
   parser = argparse.ArgumentParser(description="CLI for Messages.")
   parser.add_argument(
       "destination",
-      help="Message destination archive",
-      type=partial(Archive.from_user, ex_cls=argparse.ArgumentTypeError))
+      help="Message destination archive")
   parser.add_argument(
       '--merge',
       help="Message source archive(s)",
       action='append',
-      type=partial(Archive.from_user, ex_cls=argparse.ArgumentTypeError))
+      default=[])
   args = parser.parse_args()
-  Messages(args.destination, args.merge).cmdloop()
+
+  # pylint: disable=import-outside-toplevel
+  from .archive import Archive
+  from .messages import Messages
+
+  try:
+    destination = Archive(args.destination)
+    destination.merge_all(args.merge)
+  except ValueError as ex:
+    parser.error(str(ex))
+  Messages(destination).cmdloop()
 
 if __name__ == "__main__":
   main()
@@ -3,11 +3,117 @@
 Primary data model and operational logic for message archives.
 """
 
+import bisect
+from collections import namedtuple
 from datetime import datetime
+import itertools
 from pathlib import Path
 import re
+import threading
 
 from messages import file_utils
+from messages.index import PrefixTree
+from messages.stats import ChatTable
+
+CHAT_PATTERN = re.compile(
+    r"(?P<chat>(?:Chat with )?(?P<participant>.+?)(?: et al)?)"
+    r" on \d\d\d\d-\d\d-\d\d at ")
+
+Mismatch = namedtuple("Mismatch", ("path", "check", "expected", "actual"))
+
+POLICIES = {
+    "keep-destination": lambda stat, other_stat: "ignore",
+    "prefer-larger": lambda stat, other_stat: (
+        "replace" if other_stat.st_size > stat.st_size else "ignore"),
+    "prefer-newer-mtime": lambda stat, other_stat: (
+        "replace" if other_stat.st_mtime > stat.st_mtime else "ignore"),
+    "keep-both-with-suffix": lambda stat, other_stat: "rename",
+}
+
+_PLAN_DESTINATION = {}
+
+def classify_size(size, other_size):
+  """Decides how a source chat merges, given the sizes of both chats.
+
+  Args:
+      size: The size of the destination chat with the same name, or None.
+      other_size: The size of the source chat.
+
+  Returns:
+      The name of the Directory list the source chat belongs in.
+  """
+  if size is None:
+    return "merges"
+  return "ignores" if size == other_size else "conflicts"
+
+def archive_root(archive):
+  """Resolves the root of an archive given by the user.
+
+  Args:
+      archive: The relative path given by the user as the root.
+
+  Returns:
+      A Path object.
+
+  Raises:
+      ValueError: The requested root is not a message archive.
+  """
+  path = Path(archive).resolve()
+  if not path.exists() or not path.is_dir():
+    raise ValueError(f"{archive} is not a Messages archive.")
+  return path
+
+def init_planner(destination):
+  """Sets the destination that plan_source classifies against.
+
+  Runs once in each worker process.
+
+  Args:
+      destination: A {directory name: {chat name: size}} dictionary.
+  """
+  _PLAN_DESTINATION.clear()
+  _PLAN_DESTINATION.update(destination)
+
+def plan_source(archive):
+  """Scans a source archive and classifies its chats against a destination.
+
+  Runs in a worker process after init_planner.
+
+  Args:
+      archive: The relative path given by the user as the root.
+
+  Returns:
+      A list of (directory name, entries) tuples in scan order, where each
+      entry is a (relative chat path, size, outcome) tuple.
+
+  Raises:
+      ValueError: The requested root is not a message archive.
+  """
+  path = archive_root(archive)
+  scan = []
+  for directory in sorted(filter(lambda d: d.is_dir(), path.iterdir())):
+    sizes = _PLAN_DESTINATION.get(directory.name, {})
+    entries = []
+    for chat in Directory(directory).chats:
+      size = chat.stat().st_size
+      entries.append((str(chat.relative_to(directory)), size,
+                      classify_size(sizes.get(chat.name), size)))
+    scan.append((directory.name, entries))
+  return scan
+
+def parse_chat(name):
+  """Parses the names of a chat from its file name.
+
+  Args:
+      name: A chat file name, such as "Chat with Peach et al on ...".
+
+  Returns:
+      A (chat name, participant name) tuple; (None, None) if unrecognized.
+  """
+  match = CHAT_PATTERN.match(name)
+  if not match:
+    return None, None
+  return match.group("chat"), match.group("participant")
 
 class Directory:
   """Models a directory of chat files.
@@ -22,25 +128,40 @@ class Directory:
       conflicts: A list of Paths for source chats that conflict with these.
       ignores: A list of Paths for source chats to be ignored.
       manual_ignores: A list of Paths the user requests to be ignored.
+      replaces: A list of Paths for source chats that replace chats here.
+      targets: A {Path: name} dictionary of merges renamed to avoid a chat.
   """
   pattern = re.compile(r"\d\d\d\d-\d\d-\d\d")
 
-  def __init__(self, path=None):
+  def __init__(self, path=None, chats=None):
     """Creates a Directory instance from a path.
 
     Args:
         path: Path object.
+        chats: A list of chat Paths already known; scanned from path if None.
     """
     self.path = path
 
     if not self.pattern.match(path.name):
       raise ValueError(f"{path} is not a Messages archive directory.")
 
-    self.chats = sorted(self.path.rglob("*.ichat"))
+    if chats is None:
+      chats = self.path.rglob("*.ichat")
+    self.chats = sorted(chats)
     self.merges = []
     self.conflicts = []
     self.ignores = []
     self.manual_ignores = []
+    self.replaces = []
+    self.targets = {}
+
+  def classified(self):
+    """Lists the source chat lists whose state merging decides.
+
+    Returns:
+        A tuple of the merges, conflicts, ignores and replaces lists.
+    """
+    return self.merges, self.conflicts, self.ignores, self.replaces
 
   def chat_for_name(self, other_name):
     """Gets the chat in this directory with the given name.
@@ -53,23 +174,127 @@ class Directory:
     """
     return next(filter(lambda chat: chat.name == other_name, self.chats), None)
 
-  def merge(self, other_dir):
+  def merge(self, other_dir, plan=None):
     """Merges a directory into this Directory instance.
 
     Args:
         other_dir: The Directory object to merge.
+        plan: A {Path: outcome} dictionary of classifications made ahead of
+            time by plan_source; None to classify here.
     """
+    self.apply(self.classify_all(other_dir, plan))
+
+  def classify_all(self, other_dir, plan=None):
+    """Decides how each chat of a source directory merges, changing nothing.
+
+    Args:
+        other_dir: The Directory object to merge.
+        plan: A {Path: outcome} dictionary of classifications made ahead of
+            time by plan_source; None to classify here.
+
+    Returns:
+        A {list name: [Path]} dictionary to pass to apply.
+    """
+    classified = {"merges": [], "conflicts": [], "ignores": []}
     for other_chat in other_dir.chats:
-      chat = self.chat_for_name(other_chat.name)
-      if chat:
-        statinfo = chat.stat()
-        other_statinfo = other_chat.stat()
-        if statinfo.st_size == other_statinfo.st_size:
-          self.ignores.append(other_chat)
-        else:
-          self.conflicts.append(other_chat)
+      if plan is None:
+        size = self.chat_size(other_chat.name)
+        outcome_name = classify_size(size, other_chat.stat().st_size)
       else:
-        self.merges.append(other_chat)
+        outcome_name = plan[other_chat]
+      classified[outcome_name].append(other_chat)
+    return classified
+
+  def apply(self, classified):
+    """Adds source chats classified by classify_all to the merge state.
+
+    Args:
+        classified: A {list name: [Path]} dictionary.
+    """
+    for name, chats in classified.items():
+      getattr(self, name).extend(chats)
+
+  def chat_size(self, other_name):
+    """Gets the size of the chat in this directory with the given name.
+
+    Args:
+        other_name: string name from a path.
+
+    Returns:
+        The size in bytes if a chat matches other_name; else None.
+    """
+    chat = self.chat_for_name(other_name)
+    return chat.stat().st_size if chat else None
+
+  def classify(self, other_chat):
+    """Decides how a source chat merges into this directory.
+
+    Args:
+        other_chat: A Path object to a chat from a source archive.
+
+    Returns:
+        The merges, conflicts or ignores list the chat belongs in.
+    """
+    size = self.chat_size(other_chat.name)
+    return getattr(self, classify_size(size, other_chat.stat().st_size))
+
+  def unclassify(self, other_chat):
+    """Removes a source chat from the merge state of this directory.
+
+    Args:
+        other_chat: A Path object to a chat from a source archive.
+
+    Returns:
+        True if the chat was in the merges, conflicts, ignores or replaces;
+        else False.
+    """
+    self.targets.pop(other_chat, None)
+    for chats in self.classified():
+      if other_chat in chats:
+        chats.remove(other_chat)
+        return True
+    return False
+
+  def reclassify(self, name):
+    """Classifies again the source chats with a name, after it changed here.
+
+    Args:
+        name: A chat file name.
+    """
+    others = [chat for chats in self.classified()
+              for chat in chats if chat.name == name]
+    for other_chat in others:
+      self.unclassify(other_chat)
+      self.classify(other_chat).append(other_chat)
+
+  def reclassify_chat(self, other_chat):
+    """Classifies a source chat again after it changed on disk.
+
+    Args:
+        other_chat: A Path object to a chat from a source archive.
+    """
+    self.unclassify(other_chat)
+    if other_chat.is_file() and other_chat not in self.manual_ignores:
+      self.classify(other_chat).append(other_chat)
+
+  def refresh(self, chat):
+    """Updates the chats of this directory after a chat changed on disk.
+
+    Args:
+        chat: A Path object to a chat in this directory.
+
+    Returns:
+        True if the chat was added or removed; else False.
+    """
+    index = bisect.bisect_left(self.chats, chat)
+    present = index < len(self.chats) and self.chats[index] == chat
+    if chat.is_file() and not present:
+      self.chats.insert(index, chat)
+      return True
+    if not chat.is_file() and present:
+      del self.chats[index]
+      return True
+    return False
 
   def ignore(self, chat):
     """Sets the given chat to be ignored in this Directory.
@@ -77,27 +302,123 @@ class Directory:
     Args:
         chat: A Path object to a chat to ignore.
     """
-    def ignore_chat(chats):
-      if chat not in chats:
-        return False
+    if not self.unclassify(chat):
+      return False
 
-      chats.remove(chat)
-      self.manual_ignores.append(chat)
-      return True
+    self.manual_ignores.append(chat)
+    return True
+
+  def resolve(self, policy, dry_run=False):
+    """Resolves every conflict in this directory with a policy.
+
+    Conflicting source chats with the same name compete for one slot, so
+    at most one of them replaces the chat here and the others are ignored.
+    Conflicts involving a chat no longer on disk are skipped and stay.
+
+    Args:
+        policy: A function from POLICIES, called with the stat results of
+            the chat here, or the best source chat so far, and the
+            conflicting source chat.
+        dry_run: True to count outcomes without changing any state.
+
+    Returns:
+        A {outcome: count} dictionary, with outcomes "ignore", "replace",
+        "rename" and "skip".
+    """
+    candidates = {}
+    for other_chat in self.conflicts:
+      candidates.setdefault(other_chat.name, []).append(other_chat)
+    replaced = {chat.name: chat for chat in self.replaces}
+
+    outcomes = {}
+    for name, others in candidates.items():
+      best = replaced.get(name, self.chat_for_name(name))
+      try:
+        stats = {chat: chat.stat() for chat in [best, *others]}
+      except OSError:
+        # Removed since it was scanned; a refresh classifies it again.
+        outcomes["skip"] = outcomes.get("skip", 0) + len(others)
+        continue
+
+      renames, winner = [], None
+      for other_chat in others:
+        outcome = policy(stats[best], stats[other_chat])
+        if outcome == "rename":
+          renames.append(other_chat)
+        elif outcome == "replace":
+          best = winner = other_chat
+      ignores = [c for c in others if c is not winner and c not in renames]
+
+      for outcome, chats in (("rename", renames), ("ignore", ignores),
+                             ("replace", [winner] if winner else [])):
+        if chats:
+          outcomes[outcome] = outcomes.get(outcome, 0) + len(chats)
+      if dry_run:
+        continue
+
+      for other_chat in others:
+        self.conflicts.remove(other_chat)
+      for other_chat in renames:
+        self.targets[other_chat] = self.free_name(name)
+        self.merges.append(other_chat)
+      self.ignores.extend(ignores)
+      if winner:
+        if name in replaced:
+          self.replaces.remove(replaced[name])
+          self.ignores.append(replaced[name])
+        self.replaces.append(winner)
+    return outcomes
+
+  def free_name(self, name):
+    """Finds a chat name not used here by appending a number.
+
+    Args:
+        name: A chat file name, such as "Peach on ... at 20.45.32.ichat".
+
+    Returns:
+        A file name such as "Peach on ... at 20.45.32 2.ichat".
+    """
+    taken = {chat.name for chat in self.chats}
+    taken.update(chat.name for chat in self.merges if chat not in self.targets)
+    taken.update(self.targets.values())
+
+    stem, suffix = Path(name).stem, Path(name).suffix
+    for number in itertools.count(2):
+      candidate = f"{stem} {number}{suffix}"
+      if candidate not in taken:
+        return candidate
+    return name
+
+  def mark(self):
+    """Records the current merge state for a later reset.
+
+    Returns:
+        An opaque value to pass to reset.
+    """
+    return tuple(map(len, self.classified()))
 
-    return any(map(ignore_chat, (self.merges, self.conflicts, self.ignores)))
+  def reset(self, mark):
+    """Discards merge state added since the given mark.
 
-  def flush(self, out, simulate):
+    Args:
+        mark: A value returned by mark.
+    """
+    for chats, length in zip(self.classified(), mark):
+      del chats[length:]
+
+  def flush(self, out, simulate, created=None):
     """Writes the changes in this directory to disk.
 
     Args:
         out: Function to write output.
         simulate: True to simulate the flush but not write.
+        created: Function called as created(path, source) before each
+            directory or chat is written; source is None for directories.
 
     Returns:
         The number of chats merged into this directory.
     """
-    if not self.merges:
+    if not self.merges and not self.replaces:
       return 0
 
     out()
@@ -106,15 +427,30 @@ class Directory:
       out(f"Entered {self.path}.")
     else:
       if not simulate:
+        if created:
+          created(self.path, None)
         file_utils.mk_chat_dir(self.path)
       out(f"Created {self.path}.")
 
     for chat in self.merges:
+      path = self.path / self.targets.get(chat, chat.name)
       if not simulate:
+        if created:
+          created(path, chat)
+        file_utils.create_chat(path, source=chat)
+      if path.name == chat.name:
+        out(f"  Merged {chat}.")
+      else:
+        out(f"  Merged {chat} as {path.name}.")
+
+    for chat in self.replaces:
+      if not simulate:
+        if created:
+          created(self.path / chat.name, chat)
         file_utils.create_chat(self.path / chat.name, source=chat)
-      out(f"  Merged {chat}.")
+      out(f"  Replaced with {chat}.")
 
-    return len(self.merges)
+    return len(self.merges) + len(self.replaces)
 
 class Archive:
   """Models a message archive.
@@ -125,15 +461,26 @@ class Archive:
       path: A Path object representing the archive root.
       directories: A {name: Directory} dictionary.
       sources: A {Path: Archive} dictionary of merged sources.
+      lock: A lock to hold while reading or changing merge state.
+      names: A PrefixTree of directory, chat and participant names.
+      table: A ChatTable of metadata for chats here and in sources.
+      conflict_count: The number of conflicts across all directories.
+      flushed: A list of (path, source) tuples written by the last flush;
+          source is None for directories.
+
+  Long operations accept a progress callback, called as progress(done, total)
+  between directories. An exception raised by the callback aborts the
+  operation, leaving merge state as it was before the call.
   """
   @classmethod
-  def from_user(cls, archive, ex_cls=ValueError):
+  def from_user(cls, archive, ex_cls=ValueError, progress=None):
     """Creates an Archive instance from user input.
 
     Args:
         cls: Archive class.
         archive: The relative path given by the user as the root.
         ex_cls: Exception class to raise on error.
+        progress: Function to report scan progress.
 
     Returns:
         An Archive object.
@@ -142,15 +489,17 @@ class Archive:
         ex_cls: The requested root is not a message archive.
     """
     try:
-      return cls(archive)
+      return cls(archive, progress=progress)
     except ValueError as ex:
       raise ex_cls(ex)
 
-  def __init__(self, archive=None):
+  def __init__(self, archive=None, progress=None, scan=None):
     """Initializes an Archive instance.
 
     Args:
         archive: The relative path given by the user as the root.
+        progress: Function to report scan progress.
+        scan: A scan of archive returned by plan_source; None to scan here.
 
     Raises:
         ValueError: The requested root is not a message archive.
@@ -158,42 +507,269 @@ class Archive:
     self.path = Path(archive).resolve()
     self.directories = {}
     self.sources = {}
+    self.lock = threading.RLock()
+    self.names = PrefixTree()
+    self.table = ChatTable(self.path)
+    self.flushed = []
+    self.conflict_count = 0
+    self._merging = []
+
+    if scan is not None:
+      for name, entries in scan:
+        chats = [self.path / name / chat for chat, _, _ in entries]
+        self.directories[name] = Directory(self.path / name, chats=chats)
+        self.index(self.directories[name],
+                   {chat: size for chat, (_, size, _) in zip(chats, entries)})
+      return
+
+    archive_root(archive)
+    paths = sorted(filter(lambda d: d.is_dir(), self.path.iterdir()))
+    for index, directory in enumerate(paths):
+      self.directories[directory.name] = Directory(directory)
+      self.index(self.directories[directory.name])
+      if progress:
+        progress(index + 1, len(paths))
 
-    if not self.path.exists() or not self.path.is_dir():
-      raise ValueError(f"{archive} is not a Messages archive.")
+  def index(self, directory, sizes=None):
+    """Adds the names and chat metadata in a directory to the indexes.
 
-    for directory in sorted(filter(lambda d: d.is_dir(), self.path.iterdir())):
-      self.directories[directory.name] = Directory(directory)
+    Args:
+        directory: The Directory object to index.
+        sizes: A {Path: size} dictionary of known chat sizes; None to stat.
+    """
+    self.names.insert(directory.path.name)
+    for chat in directory.chats:
+      chat_name, participant = parse_chat(chat.name)
+      self.names.update(filter(None, (chat_name, participant)))
+      size = sizes[chat] if sizes is not None else chat.stat().st_size
+      self.table.append(chat, size, participant)
+
+  def root_for(self, path):
+    """Finds the opened archive that contains a path.
+
+    Args:
+        path: A Path object.
+
+    Returns:
+        This Archive or one of its sources; None if neither contains path.
+    """
+    for archive in itertools.chain([self], self.sources.values()):
+      if archive.path == path or archive.path in path.parents:
+        return archive
+    return None
+
+  def refresh(self, path):
+    """Applies a change on disk to the merge state.
+
+    Chats added, removed or modified at or below path, in this archive or a
+    source, update the directories and name indexes; only source chats with
+    an affected name are classified again.
+
+    Args:
+        path: A Path object that was created, removed or modified.
+
+    Returns:
+        The number of chats whose state was updated.
+    """
+    with self.lock:
+      root = self.root_for(path)
+      if root is None:
+        return 0
+      if path == root.path:
+        names = set(root.directories)
+        names.update(p.name for p in root.path.iterdir())
+        return sum(self.refresh(root.path / name) for name in sorted(names))
+
+      name = path.relative_to(root.path).parts[0]
+      if not Directory.pattern.match(name):
+        return 0
+
+      if name not in root.directories:
+        root.directories[name] = Directory(root.path / name, chats=[])
+        root.names.insert(name)
+        if root is not self:
+          self.names.insert(name)
+      directory = root.directories[name]
+
+      if path.suffix == ".ichat":
+        chats = {path}
+      else:
+        chats = {c for c in directory.chats if path == c or path in c.parents}
+        if path.is_dir():
+          chats.update(path.rglob("*.ichat"))
+
+      for chat in chats:
+        self.refresh_chat(root, directory, chat)
+      root.directories = {k: root.directories[k]
+                          for k in sorted(root.directories)}
+      return len(chats)
+
+  def refresh_chat(self, root, directory, chat):
+    """Applies a change to one chat in this archive or a source.
+
+    Args:
+        root: This Archive or the source Archive containing chat.
+        directory: The Directory object of root containing chat.
+        chat: A Path object to the changed chat.
+    """
+    exists = chat.is_file()
+    if directory.refresh(chat):
+      names = [n for n in parse_chat(chat.name) if n]
+      indexes = {id(root.names): root.names, id(self.names): self.names}
+      for index in indexes.values():
+        for name in names:
+          if exists:
+            index.insert(name)
+          else:
+            index.discard(name)
+
+    tables = [(root.table, 0)]
+    if root is not self:
+      tables.append((self.table, self.table.source_id(root.path)))
+    for table, source in tables:
+      table.discard(chat)
+      if exists:
+        table.append(chat, chat.stat().st_size, parse_chat(chat.name)[1],
+                     source)
+
+    name = directory.path.name
+    if name not in self.directories:
+      self.directories[name] = Directory(self.path / name)
+      self.directories = {k: self.directories[k]
+                          for k in sorted(self.directories)}
+    if root is self:
+      self.tracked(directory, directory.reclassify, chat.name)
+      for changed in self._merging:
+        changed.add((name, chat.name))
+    else:
+      destination = self.directories[name]
+      self.tracked(destination, destination.reclassify_chat, chat)
 
-  def merge(self, other):
+  def merge(self, other, progress=None, plan=None):
     """Merges an archive into this Archive instance.
 
+    Chats are classified without holding the lock, which is taken only to
+    apply the results, so readers are not blocked by a long merge. Names
+    refreshed here in the meantime are classified again once applied.
+
     Args:
         other: The Archive object to merge.
+        progress: Function to report merge progress.
+        plan: A {Path: outcome} dictionary of classifications made ahead of
+            time by plan_source; None to classify here.
     """
     if other.path in self.sources:
       raise ValueError(f"{other.path} is already merged.")
 
-    self.sources[other.path] = other
-
-    for name, otherdir in other.directories.items():
-      if name not in self.directories:
-        self.directories[name] = Directory(self.path / name)
-      self.directories[name].merge(otherdir)
+    changed = set()
+    with self.lock:
+      self._merging.append(changed)
+    try:
+      self._merge(other, changed, progress, plan)
+    finally:
+      with self.lock:
+        self._merging.remove(changed)
+
+  def _merge(self, other, changed, progress, plan):
+    classified = {}
+    for index, (name, otherdir) in enumerate(other.directories.items()):
+      directory = self.directories.get(name) or Directory(self.path / name)
+      classified[name] = (directory, directory.classify_all(otherdir, plan))
+      if progress:
+        progress(index + 1, len(other.directories))
+
+    with self.lock:
+      if other.path in self.sources:
+        raise ValueError(f"{other.path} is already merged.")
+
+      marks = {name: d.mark() for name, d in self.directories.items()}
+      try:
+        self.sources[other.path] = other
+        for name, (directory, chats) in classified.items():
+          directory = self.directories.setdefault(name, directory)
+          self.tracked(directory, directory.apply, chats)
+        for name, chat_name in sorted(changed):
+          directory = self.directories[name]
+          self.tracked(directory, directory.reclassify, chat_name)
+      except BaseException:
+        del self.sources[other.path]
+        for name, directory in list(self.directories.items()):
+          if name in marks:
+            self.tracked(directory, directory.reset, marks[name])
+          else:
+            self.conflict_count -= len(directory.conflicts)
+            del self.directories[name]
+        raise
+
+      self.directories = (
+          {k: self.directories[k] for k in sorted(self.directories)})
+      self.names.update(other.names)
+      self.table.extend(other.table)
+
+  def merge_all(self, archives, workers=None, progress=None):
+    """Scans and merges several source archives using a process pool.
+
+    Workers scan and classify the sources concurrently against the chats
+    originally in this archive. Their plans are applied in the given order,
+    so the result matches merging each source in turn.
 
-    self.directories = (
-        {k: self.directories[k] for k in sorted(self.directories)})
+    Args:
+        archives: A list of relative paths given by the user as roots.
+        workers: The number of worker processes; a default if None.
+        progress: Function to report merge progress per source.
 
-  def search(self, word):
+    Raises:
+        ValueError: A requested root is not a message archive.
+    """
+    if len(archives) < 2:
+      for index, archive in enumerate(archives):
+        self.merge(Archive(archive))
+        if progress:
+          progress(index + 1, len(archives))
+      return
+
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ProcessPoolExecutor
+
+    destination = {}
+    for name, directory in self.directories.items():
+      sizes = destination[name] = {}
+      for chat in reversed(directory.chats):
+        sizes[chat.name] = self.table.size(chat)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_planner,
+                             initargs=(destination,)) as executor:
+      futures = [executor.submit(plan_source, archive) for archive in archives]
+      try:
+        for index, (archive, future) in enumerate(zip(archives, futures)):
+          scan = future.result()
+          source = Archive(archive, scan=scan)
+          plan = {source.path / name / chat: chat_outcome
+                  for name, entries in scan
+                  for chat, _, chat_outcome in entries}
+          self.merge(source, plan=plan)
+          if progress:
+            progress(index + 1, len(archives))
+      except BaseException:
+        for future in futures:
+          future.cancel()
+        raise
+
+  def search(self, word, progress=None):
     """Searches the archive for chats matching the provided word.
 
     Args:
         word: A substring to find in the name of archive chats.
+        progress: Function to report search progress.
 
     Returns:
         An iterator for Path objects that match the search word.
     """
-    results = self.path.rglob(f"*{word}*")
+    results = []
+    for index, directory in enumerate(self.directories.values()):
+      results.extend(directory.path.rglob(f"*{word}*"))
+      if progress:
+        progress(index + 1, len(self.directories))
     return sorted(filter(lambda path: path.is_file(), results))
 
   def ignore(self, chats):
@@ -205,8 +781,60 @@ class Archive:
     Returns:
         A list of Path objects which were ignored.
     """
-    return [chat for chat in chats if
-            self.directories[chat.parent.name].ignore(chat)]
+    with self.lock:
+      return [chat for chat in chats if self.tracked(
+          self.directories[chat.parent.name],
+          self.directories[chat.parent.name].ignore, chat)]
+
+  def resolve(self, policy, dry_run=False, progress=None):
+    """Resolves every conflict in one pass with a policy.
+
+    Cancelling through progress stops between directories; conflicts already
+    resolved stay resolved.
+
+    Args:
+        policy: A name from POLICIES.
+        dry_run: True to count outcomes without changing any state.
+        progress: Function to report resolve progress.
+
+    Returns:
+        A {outcome: count} dictionary, with outcomes "ignore", "replace",
+        "rename" and "skip".
+
+    Raises:
+        ValueError: The policy is unknown.
+    """
+    if policy not in POLICIES:
+      raise ValueError(f"{policy} is not one of {', '.join(POLICIES)}.")
+
+    outcomes = {}
+    with self.lock:
+      conflicted = [d for d in self.directories.values() if d.conflicts]
+      for index, directory in enumerate(conflicted):
+        found = self.tracked(directory, directory.resolve,
+                             POLICIES[policy], dry_run)
+        for outcome, count in found.items():
+          outcomes[outcome] = outcomes.get(outcome, 0) + count
+        if progress:
+          progress(index + 1, len(conflicted))
+    return outcomes
+
+  def tracked(self, directory, change, *args):
+    """Applies a change to a directory, keeping conflict_count current.
+
+    Args:
+        directory: The Directory object that change modifies.
+        change: A Directory method to call.
+        *args: Arguments for change.
+
+    Returns:
+        The result of change.
+    """
+    before = len(directory.conflicts)
+    try:
+      return change(*args)
+    finally:
+      self.conflict_count += len(directory.conflicts) - before
 
   def can_flush(self):
     """Determines if this Archive instance can be flushed to disk.
@@ -214,28 +842,81 @@ class Archive:
     Returns:
         True if there are no conflicts; else False.
     """
-    return not any(filter(lambda d: d.conflicts, self.directories.values()))
+    return self.conflict_count == 0
 
-  def flush(self, out, simulate=False):
+  def flush(self, out, simulate=False, progress=None, created=None):
     """Writes the changes in this archive to disk.
 
+    Cancelling through progress stops between directories; chats already
+    written stay on disk.
+
     Args:
         out: Function to write output.
         simulate: True to simulate the flush but not write.
+        progress: Function to report flush progress.
+        created: Function called as created(path, source) before each
+            directory or chat is written, such as Snapshot.record.
 
     Raises:
         ValueError: There are unresolved conflicts.
     """
-    if not self.can_flush():
-      raise ValueError("Resolve conflicts before flush.")
+    with self.lock:
+      if not self.can_flush():
+        raise ValueError("Resolve conflicts before flush.")
 
-    out(f"Flushing {self.path} at {datetime.now()}")
-    for source in self.sources:
-      out(f"  with source {source}")
+      out(f"Flushing {self.path} at {datetime.now()}")
+      for source in self.sources:
+        out(f"  with source {source}")
 
-    merge_count = 0
-    for directory in self.directories.values():
-      merge_count += directory.flush(out, simulate)
+      if not simulate:
+        self.flushed = []
+      def record(path, source):
+        if created:
+          created(path, source)
+        self.flushed.append((path, source))
 
-    out()
-    out(f"Done! Merged {merge_count} chats.")
+      merge_count = 0
+      for index, directory in enumerate(self.directories.values()):
+        merge_count += directory.flush(out, simulate, record)
+        if progress:
+          progress(index + 1, len(self.directories))
+
+      out()
+      out(f"Done! Merged {merge_count} chats.")
+
+  def verify(self, workers=None, progress=None):
+    """Checks the entries written by the last flush.
+
+    Chat contents are compared to their sources and extended attributes to
+    the values file_utils writes, spread across a pool of worker threads.
+
+    Args:
+        workers: The number of worker threads; a default if None.
+        progress: Function to report verify progress.
+
+    Returns:
+        A list of Mismatch tuples, in flush order.
+    """
+    def check(entry):
+      path, source = entry
+      if source is None:
+        return path, file_utils.verify_chat_dir(path)
+      return path, file_utils.verify_chat(path, source)
+
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+
+    mismatches = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      futures = [executor.submit(check, entry) for entry in self.flushed]
+      try:
+        for index, future in enumerate(futures):
+          path, found = future.result()
+          mismatches.extend(Mismatch(path, *mismatch) for mismatch in found)
+          if progress:
+            progress(index + 1, len(futures))
+      except BaseException:
+        for future in futures:
+          future.cancel()
+        raise
+    return mismatches
@@ -1,14 +1,15 @@
 """File utilities specific to message archives.
 
-Wraps basic file copy/create to handle extended attribute.
+Wraps basic file copy/create to handle extended attribute. The xattr module
+is imported on first use to keep it out of startup.
 """
 
 from datetime import date
+import hashlib
+import os
 import shutil
 import time
 
-import xattr
-
 DIR_ARGS = {"mode": 0o700}
 FILE_ARGS = {"mode": 0o644}
 
@@ -19,12 +20,16 @@ XATTR_QTINE_KEY = "com.apple.quarantine"
 XATTR_QTINE_VAL_FMT = "0082;%08x;Messages"
 XATTR_QTINE_DIR_VAL = bytes(XATTR_QTINE_VAL_FMT % 0, "ascii")
 
+DIGEST_CHUNK = 1 << 20
+
 def mk_chat_dir(path):
   """Creates a directory to contain chats.
 
   Args:
       path: Path object to the chat directory.
   """
+  import xattr # pylint: disable=import-outside-toplevel
+
   path.mkdir(**DIR_ARGS)
   xattr.setxattr(path, XATTR_QTINE_KEY, XATTR_QTINE_DIR_VAL)
 
@@ -45,13 +50,94 @@ def get_qtine_val(path):
 def create_chat(path, source=None):
   """Creates a chat file with appropriate (extended) attributes.
 
+  An existing chat is replaced by a new file rather than rewritten in place,
+  so hardlinks to it keep the old contents.
+
   Args:
       path: Path object to the chat file.
       source: Path to source file to copy.
   """
-  if source:
+  import xattr # pylint: disable=import-outside-toplevel
+
+  if source and path.exists():
+    temp = path.with_name(f".{path.name}.tmp")
+    shutil.copy(source, temp)
+    os.replace(temp, path)
+  elif source:
     shutil.copy(source, path)
 
   path.touch(**FILE_ARGS)
   xattr.setxattr(path, XATTR_QTINE_KEY, get_qtine_val(path))
   xattr.setxattr(path, XATTR_FINDER_KEY, XATTR_FINDER_VAL)
+
+def digest(path):
+  """Hashes file contents without reading the whole file into memory.
+
+  Args:
+      path: Path object to the file.
+
+  Returns:
+      The SHA-256 hex digest string.
+  """
+  sha = hashlib.sha256()
+  with path.open("rb") as stream:
+    for chunk in iter(lambda: stream.read(DIGEST_CHUNK), b""):
+      sha.update(chunk)
+  return sha.hexdigest()
+
+def get_xattrs(path, keys=(XATTR_QTINE_KEY, XATTR_FINDER_KEY)):
+  """Reads extended attributes through a single handle.
+
+  Args:
+      path: Path object to the file or directory.
+      keys: The attribute names to read.
+
+  Returns:
+      A {key: bytes} dictionary; missing attributes map to None.
+  """
+  import xattr # pylint: disable=import-outside-toplevel
+
+  attrs = xattr.xattr(path)
+  return {key: attrs.get(key) if key in attrs else None for key in keys}
+
+def verify_chat_dir(path):
+  """Checks a chat directory created by mk_chat_dir.
+
+  Args:
+      path: Path object to the chat directory.
+
+  Returns:
+      A list of (check, expected, actual) tuples for each mismatch.
+  """
+  if not path.is_dir():
+    return [("exists", "directory", None)]
+
+  actual = get_xattrs(path, (XATTR_QTINE_KEY,))[XATTR_QTINE_KEY]
+  if actual != XATTR_QTINE_DIR_VAL:
+    return [(XATTR_QTINE_KEY, XATTR_QTINE_DIR_VAL, actual)]
+  return []
+
+def verify_chat(path, source):
+  """Checks a chat file created by create_chat.
+
+  Args:
+      path: Path object to the chat file.
+      source: Path to the source file it was copied from.
+
+  Returns:
+      A list of (check, expected, actual) tuples for each mismatch.
+  """
+  if not path.is_file():
+    return [("exists", "file", None)]
+
+  mismatches = []
+  expected, actual = digest(source), digest(path)
+  if expected != actual:
+    mismatches.append(("content", expected, actual))
+
+  attrs = get_xattrs(path)
+  for key, expected in ((XATTR_QTINE_KEY, get_qtine_val(path)),
+                        (XATTR_FINDER_KEY, XATTR_FINDER_VAL)):
+    if attrs[key] != expected:
+      mismatches.append((key, expected, attrs[key]))
+  return mismatches
@@ -0,0 +1,176 @@
+"""Search indexes for message archives.
+
+Prefix trees over names found in archives, used for fast tab completion.
+"""
+
+import os
+from pathlib import Path
+
+class PrefixTree:
+  """Models a multiset of strings as a character prefix tree.
+
+  Each node is a {character: node} dictionary; the empty string key marks
+  the end of a stored word and holds how many times it was inserted.
+  """
+  _END = ""
+
+  def __init__(self, words=()):
+    """Creates a PrefixTree instance.
+
+    Args:
+        words: An iterable of strings to insert.
+    """
+    self._root = {}
+    self._size = 0
+    self.update(words)
+
+  def __len__(self):
+    return self._size
+
+  def __contains__(self, word):
+    node = self._find(word)
+    return node is not None and self._END in node
+
+  def __iter__(self):
+    return (word for word, _ in self._walk(self._root, ""))
+
+  def _find(self, prefix):
+    node = self._root
+    for char in prefix:
+      node = node.get(char)
+      if node is None:
+        return None
+    return node
+
+  def _walk(self, node, prefix):
+    stack = [(node, prefix)]
+    while stack:
+      node, prefix = stack.pop()
+      if self._END in node:
+        yield prefix, node[self._END]
+      for char in sorted(node, reverse=True):
+        if char != self._END:
+          stack.append((node[char], prefix + char))
+
+  def counts(self):
+    """Lists the stored words with how many times each was inserted.
+
+    Yields:
+        (word, count) tuples in sorted word order.
+    """
+    return self._walk(self._root, "")
+
+  def insert(self, word, count=1):
+    """Adds a word to the tree.
+
+    Args:
+        word: A non-empty string.
+        count: The number of occurrences to add.
+    """
+    node = self._root
+    for char in word:
+      node = node.setdefault(char, {})
+    if self._END not in node:
+      node[self._END] = 0
+      self._size += 1
+    node[self._END] += count
+
+  def discard(self, word):
+    """Removes one occurrence of a word, pruning nodes no longer needed.
+
+    Args:
+        word: A string; ignored if not in the tree.
+    """
+    path = [self._root]
+    for char in word:
+      node = path[-1].get(char)
+      if node is None:
+        return
+      path.append(node)
+
+    if self._END not in path[-1]:
+      return
+    path[-1][self._END] -= 1
+    if path[-1][self._END]:
+      return
+
+    del path[-1][self._END]
+    self._size -= 1
+    for depth in range(len(word), 0, -1):
+      if path[depth]:
+        break
+      del path[depth - 1][word[depth - 1]]
+
+  def update(self, words):
+    """Adds several words to the tree.
+
+    Args:
+        words: An iterable of strings, or a PrefixTree to add with counts.
+    """
+    if isinstance(words, PrefixTree):
+      for word, count in words.counts():
+        self.insert(word, count)
+      return
+    for word in words:
+      self.insert(word)
+
+  def complete(self, prefix, limit=100):
+    """Finds stored words that start with a prefix.
+
+    Only the subtree under the prefix is visited, and the walk stops once
+    limit words are found, so the cost is independent of the tree size.
+
+    Args:
+        prefix: The string typed so far.
+        limit: The maximum number of words to return.
+
+    Returns:
+        A sorted list of at most limit matching words.
+    """
+    node = self._find(prefix)
+    if node is None:
+      return []
+
+    words = []
+    for word, _ in self._walk(node, prefix):
+      words.append(word)
+      if len(words) >= limit:
+        break
+    return words
+
+class PathCompleter:
+  """Completes directory paths from cached listings.
+
+  Each directory is listed at most once, so repeated keystrokes never touch
+  the disk.
+  """
+  def __init__(self):
+    """Creates a PathCompleter instance.
+    """
+    self._listings = {}
+
+  def _listing(self, directory):
+    if directory not in self._listings:
+      try:
+        with os.scandir(directory) as entries:
+          names = [f"{entry.name}/" for entry in entries if entry.is_dir()]
+      except OSError:
+        names = []
+      self._listings[directory] = PrefixTree(names)
+    return self._listings[directory]
+
+  def complete(self, text):
+    """Finds directory paths that start with the typed text.
+
+    Args:
+        text: A partial path as typed by the user.
+
+    Returns:
+        A sorted list of directory paths, each ending with a separator.
+    """
+    head, _, tail = text.rpartition("/")
+    if text.startswith("/") and not head:
+      head = "/"
+    directory = Path(head or ".").expanduser()
+    base = f"{head}/" if head and head != "/" else head
+    return [base + name for name in self._listing(directory).complete(tail)]
@@ -0,0 +1,183 @@
+"""Background jobs for the Messages shell.
+
+Runs long archive operations on worker threads with progress and cooperative
+cancellation so the command loop stays responsive.
+"""
+
+import itertools
+import threading
+
+class Canceled(Exception):
+  """Raised inside a job when the user cancels it.
+  """
+
+class Job:
+  """Models one background operation.
+
+  Attributes:
+      id: A unique integer for the user to reference this job.
+      name: A short description of the operation.
+      state: One of "running", "done", "canceled" or "failed".
+      progress: A (done, total) tuple of the latest progress update.
+      output: A list of strings written by the job for later display.
+      error: The exception that ended the job, if any.
+  """
+  _ids = itertools.count(1)
+
+  def __init__(self, name, target):
+    """Creates a Job instance.
+
+    Args:
+        name: A short description of the operation.
+        target: Function called with this Job to perform the operation.
+    """
+    self.id = next(self._ids)
+    self.name = name
+    self.state = "running"
+    self.progress = (0, 0)
+    self.output = []
+    self.error = None
+    self._target = target
+    self._cancel = threading.Event()
+    # Not a daemon, so exiting the interpreter never cuts a job short.
+    self._thread = threading.Thread(target=self._run)
+
+  def _run(self):
+    try:
+      self._target(self)
+      self.state = "done"
+    except Canceled:
+      self.state = "canceled"
+    except Exception as ex: # pylint: disable=broad-except
+      self.error = ex
+      self.state = "failed"
+
+  def start(self):
+    """Starts running the job on a worker thread.
+    """
+    self._thread.start()
+
+  def cancel(self):
+    """Requests the job to stop at its next checkpoint.
+    """
+    self._cancel.set()
+
+  def wait(self, timeout=None):
+    """Blocks until the job finishes.
+
+    Args:
+        timeout: Seconds to wait, or None to wait indefinitely.
+
+    Returns:
+        True if the job finished; else False.
+    """
+    self._thread.join(timeout)
+    return not self._thread.is_alive()
+
+  def running(self):
+    """Determines if the job is still running.
+
+    Returns:
+        True if the job has not finished; else False.
+    """
+    return self._thread.is_alive()
+
+  def update(self, done, total):
+    """Records progress and checks for cancellation.
+
+    Suitable as a progress callback for Archive operations.
+
+    Args:
+        done: Number of work units completed.
+        total: Number of work units overall.
+
+    Raises:
+        Canceled: The user canceled this job.
+    """
+    self.progress = (done, total)
+    if self._cancel.is_set():
+      raise Canceled()
+
+  def out(self, text=None):
+    """Collects a line of output for later display.
+
+    Args:
+        text: A string to display; None for an empty line.
+    """
+    self.output.append(text or "")
+
+  def status(self):
+    """Describes the job state for display.
+
+    Returns:
+        A string with the state and, while running, the progress.
+    """
+    done, total = self.progress
+    if self.state == "running" and total:
+      return f"running {done}/{total}"
+    if self.state == "failed":
+      return f"failed: {self.error}"
+    return self.state
+
+class Jobs:
+  """Tracks background jobs started by the user.
+
+  Attributes:
+      jobs: A {id: Job} dictionary in start order.
+  """
+  def __init__(self):
+    """Creates a Jobs instance.
+    """
+    self.jobs = {}
+    self._reported = set()
+
+  def start(self, name, target):
+    """Starts a new background job.
+
+    Args:
+        name: A short description of the operation.
+        target: Function called with the Job to perform the operation.
+
+    Returns:
+        The started Job object.
+    """
+    job = Job(name, target)
+    self.jobs[job.id] = job
+    job.start()
+    return job
+
+  def get(self, job_id):
+    """Gets a job by the id shown to the user.
+
+    Args:
+        job_id: A string or integer job id.
+
+    Returns:
+        The Job object.
+
+    Raises:
+        ValueError: There is no such job.
+    """
+    try:
+      return self.jobs[int(job_id)]
+    except (KeyError, ValueError) as ex:
+      raise ValueError(f"{job_id} is not a job.") from ex
+
+  def running(self):
+    """Lists jobs that have not finished.
+
+    Returns:
+        A list of running Job objects.
+    """
+    return [job for job in self.jobs.values() if job.running()]
+
+  def finished(self):
+    """Collects jobs that finished since the last call.
+
+    Returns:
+        A list of newly finished Job objects.
+    """
+    done = [job for job in self.jobs.values()
+            if job.id not in self._reported and not job.running()]
+    self._reported.update(job.id for job in done)
+    return done
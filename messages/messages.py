@@ -6,11 +6,29 @@ archive into a current one.
 
 import atexit
 from cmd import Cmd
+import itertools
 from pathlib import Path
-import readline
 
-from messages.archive import Archive
-from messages.term_utils import colored, confirm
+from messages.archive import POLICIES, Archive
+from messages.index import PathCompleter
+from messages.jobs import Jobs
+from messages.snapshot import Snapshot
+from messages.term_utils import colored, confirm, page
+
+DIR_LABELS = {
+    "merges": "%s " % colored("+", "yellow"),
+    "conflicts": "%s " % colored("C", "red"),
+    "ignores": "%s " % colored("i", "blue"),
+}
+
+CHAT_LABELS = {
+    "chats": "    %s " % colored("o", "green"),
+    "merges": "    %s " % colored("+", "yellow"),
+    "ignores": "    %s " % colored("i", "blue"),
+    "conflicts": "    %s " % colored("CC", "red"),
+    "replaces": "    %s " % colored("R", "magenta"),
+    "manual_ignores": "    %s " % colored("ii", "blue"),
+}
 
 class Search:
   """Models a user search in a message archive.
@@ -39,6 +57,9 @@ class Messages(Cmd):
       history: Path to CLI history file.
       destination: Archive object for chat destination.
       last_search: Search object representing the last search.
+      jobs: Jobs object tracking background operations.
+      paths: PathCompleter object for completing archive paths.
+      watcher: Watcher object applying changes on disk; None if not watching.
   """
   prompt = "%s " % colored("<messages>", "cyan", attrs=["bold"], escape=True)
 
@@ -58,6 +79,9 @@ class Messages(Cmd):
 
     self.destination = destination
     self.last_search = Search()
+    self.jobs = Jobs()
+    self.paths = PathCompleter()
+    self.watcher = None
 
     for source in sources or []:
       self.destination.merge(source)
@@ -67,6 +91,8 @@ class Messages(Cmd):
 
     Handles CLI history and restarting the command prompt.
     """
+    import readline # pylint: disable=import-outside-toplevel
+
     readline.set_history_length(1000)
     atexit.register(readline.write_history_file, self.history)
     if self.history.exists():
@@ -92,6 +118,50 @@ class Messages(Cmd):
       print(f"command failed: {ex}")
       return False
 
+  def postcmd(self, stop, line):
+    """Reports background jobs that finished since the last command.
+
+    Returns:
+        stop, unchanged.
+    """
+    for job in self.jobs.finished():
+      print("%s %s: %s" % (colored(f"[{job.id}]", "magenta"),
+                           job.name, job.status()))
+      for text in job.output:
+        print(f"  {text}")
+    return stop
+
+  @staticmethod
+  def complete_argument(complete, line, begidx, endidx):
+    """Completes the whole argument of a command, spaces included.
+
+    Readline replaces only the text after its last delimiter, so each
+    completion is trimmed to start at begidx.
+
+    Args:
+        complete: Function mapping the typed argument to completions.
+        line: The current input line.
+        begidx: The start index of the text readline replaces.
+        endidx: The end index of the text readline replaces.
+
+    Returns:
+        A list of completion strings for readline.
+    """
+    _, _, argument = line[:endidx].partition(" ")
+    offset = len(argument) - (endidx - begidx)
+    return [text[offset:] for text in complete(argument) if offset >= 0]
+
+  def complete_search(self, _, line, begidx, endidx):
+    """Completes search input from indexed chat and participant names.
+    """
+    return self.complete_argument(self.destination.names.complete,
+                                  line, begidx, endidx)
+
+  def complete_merge(self, _, line, begidx, endidx):
+    """Completes merge input from cached directory listings.
+    """
+    return self.complete_argument(self.paths.complete, line, begidx, endidx)
+
   def emptyline(self):
     """Processes an empty command.
 
@@ -113,19 +183,71 @@ class Messages(Cmd):
   def do_quit(self, _):
     """Handles quitting the CLI.
 
+    Waits for running jobs so that a flush is never cut short; interrupting
+    the wait keeps the shell open.
+
     Returns:
-        True to stop processing commands.
+        True to stop processing commands; False if jobs are still running.
     """
+    running = self.jobs.running()
+    if running:
+      print(f"Waiting for {len(running)} jobs to finish.")
+      self.do_wait("")
+    if self.jobs.running():
+      print('Jobs are still running; "cancel" them or "quit" again later.')
+      return False
+    if self.watcher:
+      self.do_watch("off")
     return True
 
+  def do_jobs(self, _):
+    """Shows background jobs and their progress.
+    """
+    if not self.jobs.jobs:
+      print("No jobs.")
+    for job in self.jobs.jobs.values():
+      print("%s %s: %s" % (colored(f"[{job.id}]", "magenta"),
+                           job.name, job.status()))
+
+  def do_cancel(self, line):
+    """Cancels a background job, or all running jobs if none is given.
+
+    Args:
+        line: The id of the job to cancel.
+    """
+    jobs = [self.jobs.get(line)] if line else self.jobs.running()
+    for job in jobs:
+      job.cancel()
+      print(f"Canceling job {job.id}.")
+
+  def do_wait(self, line):
+    """Waits for a background job, or all running jobs if none is given.
+
+    Args:
+        line: The id of the job to wait for.
+    """
+    jobs = [self.jobs.get(line)] if line else self.jobs.running()
+    try:
+      for job in jobs:
+        job.wait()
+    except KeyboardInterrupt:
+      print()
+
   def do_merge(self, line):
-    """Merges an archive from a relative path as a source.
+    """Merges an archive from a relative path as a source in the background.
 
     Args:
         line: The relative path given by the user as the root.
     """
-    self.destination.merge(Archive.from_user(line))
-    return self.onecmd("list")
+    def merge(job):
+      source = Archive.from_user(line, progress=job.update)
+      self.destination.merge(source, progress=job.update)
+      if self.watcher:
+        self.watcher.add(source.path)
+      job.out(f"Merged {source.path}")
+
+    job = self.jobs.start(f"merge {line}", merge)
+    print(f"Started job {job.id}.")
 
   def do_list(self, _):
     """Shows the opened archives.
@@ -140,51 +262,102 @@ class Messages(Cmd):
       print(f"  {source}")
 
   @staticmethod
-  def print_directory(directory, full):
-    """Prints details about a chat directory.
+  def format_directory(directory, full):
+    """Formats details about a chat directory.
 
     Args:
-        directory: Directory object to print.
-        full: True to print all chats; False for limited set.
-    """
-    def print_chats(chats, padding, label):
-      for chat in chats:
-        print("%s%s %s" % (" " * padding, label, chat.name))
+        directory: Directory object to format.
+        full: True to include all chats; False for limited set.
 
-    padding = 2
+    Yields:
+        One string per output line.
+    """
     label = ""
     if not directory.chats:
       if directory.merges:
-        label += "%s " % colored("+", "yellow")
+        label = DIR_LABELS["merges"]
       elif directory.conflicts:
-        label += "%s " % colored("C", "red")
+        label = DIR_LABELS["conflicts"]
       else:
-        label += "%s " % colored("i", "blue")
+        label = DIR_LABELS["ignores"]
+
+    yield "  %s%s" % (label, directory.path.name)
+    kinds = ("chats", "merges", "ignores") if full else ()
+    for kind in kinds + ("conflicts", "replaces", "manual_ignores"):
+      prefix = CHAT_LABELS[kind]
+      for chat in getattr(directory, kind):
+        if chat in directory.targets:
+          yield f"{prefix}{chat.name} as {directory.targets[chat]}"
+        else:
+          yield prefix + chat.name
+    if not full:
+      for chat, target in directory.targets.items():
+        yield f"{CHAT_LABELS['merges']}{chat.name} as {target}"
 
-    print("%s%s%s" % (" " * padding, label, directory.path.name))
-    padding *= 2
-    if full:
-      print_chats(directory.chats, padding, colored("o", "green"))
-      print_chats(directory.merges, padding, colored("+", "yellow"))
-      print_chats(directory.ignores, padding, colored("i", "blue"))
+  @staticmethod
+  def format_summary(rows, labels):
+    """Formats counts per year and month.
+
+    Args:
+        rows: An iterable of (name, counts) tuples, where name starts with a
+            date as "YYYY-MM" and counts is a tuple of integers.
+        labels: A label string for each position of counts.
+
+    Yields:
+        One string per output line.
+    """
+    months = {}
+    for name, counts in rows:
+      total = months.setdefault(name[:7], [0] * len(labels))
+      for index, count in enumerate(counts):
+        total[index] += count
+
+    def format_counts(counts):
+      return "  ".join("%s %d" % pair for pair in zip(labels, counts))
+
+    for year, group in itertools.groupby(sorted(months), lambda m: m[:4]):
+      group = list(group)
+      totals = [sum(c) for c in zip(*(months[month] for month in group))]
+      yield "%s     %s" % (year, format_counts(totals))
+      for month in group:
+        yield "  %s  %s" % (month, format_counts(months[month]))
 
-    print_chats(directory.conflicts, padding, colored("CC", "red"))
-    print_chats(directory.manual_ignores, padding, colored("ii", "blue"))
+  def directories(self):
+    """Takes a consistent snapshot of the destination directories.
 
-  def do_show(self, _):
-    """Shows destination archive details.
+    Returns:
+        A list of Directory objects.
+    """
+    with self.destination.lock:
+      return list(self.destination.directories.values())
+
+  def do_show(self, line):
+    """Shows destination archive details; "show summary" for monthly counts.
+
+    Args:
+        line: "summary" to show counts per year and month.
     """
-    print(f"{self.destination.path}")
-    for directory in self.destination.directories.values():
-      self.print_directory(directory, full=True)
+    if line == "summary":
+      kinds = ("chats", "merges", "conflicts", "ignores")
+      rows = ((d.path.name, tuple(len(getattr(d, k)) for k in kinds))
+              for d in self.directories())
+      labels = tuple(CHAT_LABELS[k].strip() for k in kinds)
+      page(itertools.chain([f"{self.destination.path}"],
+                           self.format_summary(rows, labels)))
+      return
+
+    lines = (line for directory in self.directories()
+             for line in self.format_directory(directory, full=True))
+    page(itertools.chain([f"{self.destination.path}"], lines))
 
   def do_diff(self, _):
     """Shows archive details most relevant for merging.
     """
-    print(f"{self.destination.path}")
-    for directory in self.destination.directories.values():
-      if directory.conflicts or directory.manual_ignores:
-        self.print_directory(directory, full=False)
+    lines = (line for directory in self.directories()
+             if directory.conflicts or directory.manual_ignores or
+             directory.replaces or directory.targets
+             for line in self.format_directory(directory, full=False))
+    page(itertools.chain([f"{self.destination.path}"], lines))
 
   @staticmethod
   def print_search(search, full):
@@ -194,32 +367,48 @@ class Messages(Cmd):
         search: Search object to print.
         full: True to print all results; False for limited set.
     """
-    if full:
-      for chat in search.results:
-        print(chat)
-
     total_text = colored(f"{len(search.results)} chats", "yellow")
-    print(f"{total_text} for '{search.query}'")
+    total = f"{total_text} for '{search.query}'"
+    if full:
+      page(itertools.chain(map(str, search.results), [total]))
+    else:
+      print(total)
 
   def do_search(self, line):
     """Searches all sources for chats matching the user's input.
 
+    Runs in the background; the last search is replaced once it completes.
+
     Args:
         line: A substring to use when searching for chats.
     """
-    self.last_search = Search(line)
+    def search(job):
+      found = Search(line)
+      for source in list(self.destination.sources.values()):
+        results = source.search(line, progress=job.update)
+        results_text = colored(f"{len(results)} chats", "yellow")
+        job.out(f"Found {results_text} in {source.path}")
+        found.results.extend(results)
+
+      self.last_search = found
+      total_text = colored(f"{len(found.results)} chats", "yellow")
+      job.out(f"{total_text} for '{found.query}'")
 
-    for source in self.destination.sources.values():
-      results = source.search(line)
-      results_text = colored(f"{len(results)} chats", "yellow")
-      print(f"Found {results_text} in {source.path}")
-      self.last_search.results.extend(results)
+    job = self.jobs.start(f"search {line}", search)
+    print(f"Started job {job.id}.")
 
-    self.print_search(self.last_search, full=False)
+  def do_results(self, line):
+    """Show the results from the last search; "results summary" for counts.
 
-  def do_results(self, _):
-    """Show the results from the last search.
+    Args:
+        line: "summary" to show counts per year and month.
     """
+    if line == "summary":
+      rows = ((chat.parent.name, (1,)) for chat in self.last_search.results)
+      page(self.format_summary(rows, (colored("chats", "yellow"),)))
+      self.print_search(self.last_search, full=False)
+      return
+
     self.print_search(self.last_search, full=True)
 
   def do_ignore(self, _):
@@ -229,6 +418,51 @@ class Messages(Cmd):
     text = "Ignored %s" % colored(f"{len(ignored)} chats", "blue")
     print(f"{text} for '{self.last_search.query}' in {self.destination.path}")
 
+  def do_resolve(self, line):
+    """Resolves all conflicts with a policy; add "dry-run" to only count.
+
+    Runs as a background job. Policies are keep-destination, prefer-larger,
+    prefer-newer-mtime and keep-both-with-suffix.
+
+    Args:
+        line: A policy name, optionally followed by "dry-run".
+    """
+    policy, _, option = line.partition(" ")
+    if option not in ("", "dry-run"):
+      raise ValueError(f"{option} is not dry-run.")
+
+    dry_run = option == "dry-run"
+    def resolve(job):
+      outcomes = self.destination.resolve(policy, dry_run=dry_run,
+                                          progress=job.update)
+      skipped = outcomes.pop("skip", 0)
+      total = sum(outcomes.values())
+      counts = ", ".join(f"{outcome} {outcomes.get(outcome, 0)}"
+                         for outcome in ("ignore", "replace", "rename"))
+      verb = "Would resolve" if dry_run else "Resolved"
+      conflict_text = colored(f"{total} conflicts", "red")
+      job.out(f"{verb} {conflict_text} with {policy}: {counts}")
+      if skipped:
+        job.out(f"Skipped {skipped} conflicts with chats no longer on disk")
+      remaining = self.destination.conflict_count
+      job.out(f"{remaining} conflicts remain in {self.destination.path}")
+
+    job = self.jobs.start(f"resolve {line}", resolve)
+    print(f"Started job {job.id}.")
+
+  def complete_resolve(self, _, line, begidx, endidx):
+    """Completes resolve input from the policy names and "dry-run".
+    """
+    def complete(argument):
+      policy, space, option = argument.partition(" ")
+      if not space:
+        return [name for name in POLICIES if name.startswith(policy)]
+      if policy in POLICIES and "dry-run".startswith(option):
+        return [f"{policy} dry-run"]
+      return []
+
+    return self.complete_argument(complete, line, begidx, endidx)
+
   def do_simulate(self, _):
     """Simulates the flush of the destination archive.
     """
@@ -236,14 +470,167 @@ class Messages(Cmd):
 
   def do_flush(self, _):
     """Writes the destination archive with its current state of merges.
+
+    Links a snapshot of the destination first so that rollback can undo it.
     """
-    if self.destination.can_flush():
+    if any(job.name == "flush" for job in self.jobs.running()):
+      print(f"Already flushing {self.destination.path}.")
+    elif self.destination.can_flush():
       if confirm(f"Flush will modify {self.destination.path}."):
         path = Path.cwd() / "messages_results.txt"
         path.touch()
-        with path.open("w") as out:
-          self.destination.flush(lambda tx=None: out.write(f"{tx or ''}\n"))
+
+        def flush(job):
+          # A merge may have added conflicts since; check again before the
+          # snapshot replaces the rollback point of the last flush.
+          with self.destination.lock:
+            if not self.destination.can_flush():
+              raise ValueError("Resolve conflicts before flush.")
+            snapshot = Snapshot(self.destination.path)
+            snapshot.create(progress=job.update)
+            job.out(f"Saved snapshot {snapshot.path}")
+            with path.open("w") as out:
+              self.destination.flush(
+                  lambda tx=None: out.write(f"{tx or ''}\n"),
+                  progress=job.update, created=snapshot.record)
+          job.out(f"Wrote {path}")
+
+        job = self.jobs.start("flush", flush)
+        print(f"Started job {job.id}.")
       else:
         print("Canceled flush.")
     else:
       print(f"Resolve conflicts before flushing {self.destination.path}.")
+
+  def do_verify(self, _):
+    """Checks the chats and directories written by the last flush.
+    """
+    if not self.destination.flushed:
+      print(f"Nothing flushed to {self.destination.path}.")
+      return
+
+    def verify(job):
+      mismatches = self.destination.verify(progress=job.update)
+      count_text = colored(f"{len(mismatches)} mismatches",
+                           "red" if mismatches else "green")
+      job.out(f"Verified {len(self.destination.flushed)} entries: "
+              f"{count_text}")
+      for mismatch in mismatches:
+        job.out(f"  {mismatch.check} {mismatch.path}")
+        job.out(f"    expected {mismatch.expected!r}")
+        job.out(f"    actual   {mismatch.actual!r}")
+
+    job = self.jobs.start("verify", verify)
+    print(f"Started job {job.id}.")
+
+  def do_rollback(self, _):
+    """Undoes the last flush using the snapshot taken before it.
+    """
+    snapshot = Snapshot(self.destination.path)
+    if not snapshot.exists():
+      print(f"No snapshot of {self.destination.path}.")
+      return
+
+    entries = snapshot.entries()
+    if confirm(f"Rollback will undo {len(entries)} entries in "
+               f"{self.destination.path}."):
+      def rollback(job):
+        with self.destination.lock:
+          count = snapshot.rollback(job.out)
+          self.destination.flushed = []
+        job.out(f"Rolled back {count} entries.")
+
+      job = self.jobs.start("rollback", rollback)
+      print(f"Started job {job.id}.")
+    else:
+      print("Canceled rollback.")
+
+  def do_watch(self, line):
+    """Tracks changes on disk to the opened archives; "watch off" to stop.
+
+    Args:
+        line: "off" to stop watching.
+    """
+    if line == "off":
+      if self.watcher:
+        self.watcher.stop()
+        print(f"Stopped watching after {self.watcher.count} changes.")
+        self.watcher = None
+      else:
+        print("Not watching.")
+      return
+
+    if self.watcher and self.watcher.error:
+      self.watcher.stop()
+      print(colored(f"Watching failed after {self.watcher.count} changes: "
+                    f"{self.watcher.error}", "red"))
+      print('Use "watch" to start again.')
+      self.watcher = None
+      return
+
+    if self.watcher:
+      kind = type(self.watcher).__name__
+      print(f"Watching with {kind}: {self.watcher.count} changes applied.")
+      return
+
+    from messages.watch import watcher # pylint: disable=import-outside-toplevel
+
+    self.watcher = watcher(self.destination.refresh)
+    with self.destination.lock:
+      for path in [self.destination.path, *self.destination.sources]:
+        self.watcher.add(path)
+    self.watcher.start()
+    print(f"Watching {len(self.watcher.roots)} archives.")
+
+  @staticmethod
+  def format_report(title, rows):
+    """Formats a table of chat and byte totals.
+
+    Args:
+        title: A heading string.
+        rows: An iterable of (label, chats, bytes) tuples.
+
+    Yields:
+        One string per output line.
+    """
+    yield colored(title, "cyan", attrs=["bold"])
+    for label, chats, size in rows:
+      yield f"  {label}  {chats} chats  {size} bytes"
+
+  def do_stats(self, line):
+    """Shows chat and byte totals; "stats archive [month|contact|source]".
+
+    Totals come from metadata recorded while scanning, without reading the
+    archives again. Month and contact totals are for the destination.
+
+    Args:
+        line: "archive", optionally followed by a single report name.
+    """
+    subject, _, report = line.partition(" ")
+    if subject != "archive":
+      raise ValueError("Usage: stats archive [month|contact|source]")
+
+    # Merged sources repeat chats the destination has, so month and contact
+    # totals cover the destination alone; merges are reported separately.
+    reports = {
+        "month": ("Per month", "by_month", (0,)),
+        "contact": ("Per contact", "by_participant", (0,)),
+        "source": ("Per source", "by_source", ()),
+    }
+    if report and report not in reports:
+      raise ValueError(f"{report} is not one of {', '.join(reports)}.")
+
+    with self.destination.lock:
+      table = self.destination.table
+      results = [(title, getattr(table, method)(*args))
+                 for name, (title, method, args) in reports.items()
+                 if not report or report == name]
+      merges = [chat for directory in self.destination.directories.values()
+                for chat in directory.merges]
+      merge_size = sum(map(table.size, merges))
+
+    lines = itertools.chain.from_iterable(
+        self.format_report(title, rows) for title, rows in results)
+    merge_text = colored(f"{len(merges)} chats", "yellow")
+    page(itertools.chain(lines, [f"Merge adds {merge_text}, {merge_size} "
+                                 f"bytes, to {self.destination.path}"]))
@@ -0,0 +1,200 @@
+"""Snapshot class for rolling back message archive flushes.
+
+Links the existing archive tree into a rollback point and journals what a
+flush creates, so undo costs metadata operations rather than copies.
+"""
+
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+
+FICLONE = 0x40049409
+
+def _clone(source, target):
+  """Clones a file as a copy-on-write reflink.
+
+  Args:
+      source: Path to the existing file.
+      target: Path to the new file.
+
+  Raises:
+      OSError: The platform or filesystem does not support reflinks.
+  """
+  # pylint: disable=import-outside-toplevel
+  if sys.platform == "darwin":
+    import ctypes
+    import ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.clonefile(os.fsencode(source), os.fsencode(target), 0):
+      raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    return
+
+  import fcntl
+  with open(source, "rb") as src, open(target, "wb") as dst:
+    try:
+      fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+      os.unlink(target)
+      raise
+
+def link(source, target):
+  """Shares a file's data under a new path without copying bytes.
+
+  Uses a hardlink, or a reflink where hardlinks are not allowed.
+
+  Args:
+      source: Path to the existing file.
+      target: Path to the new file.
+  """
+  try:
+    os.link(source, target)
+  except OSError:
+    _clone(source, target)
+
+class Snapshot:
+  """Models a rollback point for an archive.
+
+  Linked files share data with the archive, so the snapshot guards against
+  files being created, removed or replaced, not rewritten in place; flush
+  never rewrites an existing file in place.
+
+  Attributes:
+      root: A Path object to the archive root.
+      path: A Path object to the snapshot, next to the root so that links
+          stay on the same filesystem.
+      tree: A Path object to the linked copy of the archive tree.
+      journal: A Path object to the list of entries a flush created or
+          replaced.
+  """
+  def __init__(self, root):
+    """Creates a Snapshot instance.
+
+    Args:
+        root: Path object to the archive root.
+    """
+    self.root = Path(root)
+    self.path = self.root.parent / f".{self.root.name}.snapshot"
+    self.tree = self.path / "tree"
+    self.journal = self.path / "journal"
+
+  def exists(self):
+    """Determines if a rollback point exists.
+
+    Returns:
+        True if the snapshot tree exists; else False.
+    """
+    return self.tree.is_dir()
+
+  def create(self, progress=None):
+    """Replaces any previous rollback point with the current archive tree.
+
+    The new snapshot is linked next to the previous one, which is replaced
+    only once the new one is complete.
+
+    Args:
+        progress: Function called as progress(done, total) per directory;
+            an exception it raises keeps the previous rollback point.
+    """
+    new = self.path.with_name(f"{self.path.name}.new")
+    if new.exists():
+      shutil.rmtree(new)
+    new.mkdir(mode=0o700)
+
+    try:
+      walk = list(os.walk(self.root))
+      for index, (directory, _, files) in enumerate(walk):
+        target = new / "tree" / Path(directory).relative_to(self.root)
+        target.mkdir(mode=0o700)
+        for name in files:
+          link(Path(directory, name), target / name)
+        if progress:
+          progress(index + 1, len(walk))
+      (new / "journal").touch(mode=0o600)
+    except BaseException:
+      shutil.rmtree(new)
+      raise
+
+    old = self.path.with_name(f"{self.path.name}.old")
+    if self.path.exists():
+      os.replace(self.path, old)
+    os.replace(new, self.path)
+    if old.exists():
+      shutil.rmtree(old)
+
+  def record(self, path, _=None):
+    """Journals an entry before a flush creates or replaces it.
+
+    Suitable as the created callback of Archive.flush.
+
+    Args:
+        path: Path object to the directory or chat about to be written.
+    """
+    kind = "replaced" if path.exists() else "created"
+    with self.journal.open("a") as journal:
+      journal.write(json.dumps([kind, str(path.relative_to(self.root))]))
+      journal.write("\n")
+
+  def entries(self):
+    """Reads the journaled entries.
+
+    Returns:
+        A list of (kind, Path) tuples in write order, where kind is
+        "created" or "replaced".
+    """
+    if not self.journal.exists():
+      return []
+    with self.journal.open() as journal:
+      return [(kind, self.root / path)
+              for kind, path in map(json.loads, journal)]
+
+  def rollback(self, out):
+    """Restores the archive to the rollback point.
+
+    Removes exactly the entries the flush created and relinks the snapshot
+    copies of exactly the chats it replaced; the rest of the archive is left
+    alone.
+
+    Args:
+        out: Function to write output.
+
+    Returns:
+        The number of entries removed or restored.
+
+    Raises:
+        ValueError: There is no rollback point.
+    """
+    if not self.exists():
+      raise ValueError(f"No snapshot of {self.root}.")
+
+    count = 0
+    for kind, path in reversed(self.entries()):
+      if kind == "replaced":
+        saved = self.tree / path.relative_to(self.root)
+        if not saved.exists():
+          out(f"Kept {path}, which is not in the snapshot.")
+          continue
+        temp = path.with_name(f".{path.name}.rollback")
+        link(saved, temp)
+        os.replace(temp, path)
+        out(f"Restored {path}.")
+        count += 1
+        continue
+
+      if path.is_dir():
+        try:
+          path.rmdir()
+        except OSError:
+          out(f"Kept {path}, which is not empty.")
+          continue
+      elif path.exists():
+        path.unlink()
+      else:
+        continue
+      out(f"Removed {path}.")
+      count += 1
+
+    self.journal.write_text("")
+    return count
@@ -0,0 +1,226 @@
+"""Columnar chat metadata for message archive analytics.
+
+Keeps scanned chat metadata in flat arrays so reports aggregate in memory,
+with NumPy when it is installed.
+"""
+
+from array import array
+from datetime import date
+import functools
+
+UNKNOWN = "(unknown)"
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+  """Imports NumPy on first use, keeping it out of startup.
+
+  Returns:
+      The numpy module; None if it is not installed.
+  """
+  try:
+    import numpy # pylint: disable=import-outside-toplevel
+  except ImportError:
+    return None
+  return numpy
+
+class ChatTable:
+  """Models chat metadata as parallel columns, one row per chat.
+
+  Attributes:
+      dates: An array of chat directory date ordinals.
+      sizes: An array of chat sizes in bytes.
+      participants: An array of ids indexing participant_names.
+      sources: An array of ids indexing source_paths.
+      live: A bytearray of 1 for current rows and 0 for removed ones.
+      participant_names: A list of participant names.
+      source_paths: A list of archive Paths; 0 is the archive itself.
+  """
+  def __init__(self, path):
+    """Creates an empty ChatTable instance.
+
+    Args:
+        path: Path object to the archive that owns the table.
+    """
+    self.dates = array("i")
+    self.sizes = array("q")
+    self.participants = array("i")
+    self.sources = array("i")
+    self.live = bytearray()
+    self.participant_names = []
+    self.source_paths = [path]
+    self._participant_ids = {}
+    self._rows = {}
+
+  def __len__(self):
+    return len(self.dates)
+
+  def participant_id(self, name):
+    """Gets the id of a participant, adding it if new.
+
+    Args:
+        name: A participant name, or None if unknown.
+
+    Returns:
+        An integer id.
+    """
+    name = name or UNKNOWN
+    if name not in self._participant_ids:
+      self._participant_ids[name] = len(self.participant_names)
+      self.participant_names.append(name)
+    return self._participant_ids[name]
+
+  def append(self, chat, size, participant, source=0):
+    """Adds a row for a chat.
+
+    Args:
+        chat: A Path object to the chat, inside a dated directory.
+        size: The chat size in bytes.
+        participant: The participant name, or None if unknown.
+        source: The id of the archive containing the chat.
+    """
+    self._rows[chat] = len(self.dates)
+    self.dates.append(date.fromisoformat(chat.parent.name[:10]).toordinal())
+    self.sizes.append(size)
+    self.participants.append(self.participant_id(participant))
+    self.sources.append(source)
+    self.live.append(1)
+
+  def discard(self, chat):
+    """Marks the row for a chat as removed.
+
+    Args:
+        chat: A Path object to the chat.
+    """
+    row = self._rows.pop(chat, None)
+    if row is not None:
+      self.live[row] = 0
+
+  def size(self, chat):
+    """Gets the recorded size of a chat.
+
+    Args:
+        chat: A Path object to the chat.
+
+    Returns:
+        The size in bytes; 0 if the chat has no row.
+    """
+    row = self._rows.get(chat)
+    return 0 if row is None else self.sizes[row]
+
+  def source_id(self, path):
+    """Gets the id of a source archive.
+
+    Args:
+        path: Path object to the archive.
+
+    Returns:
+        An integer id.
+    """
+    return self.source_paths.index(path)
+
+  def extend(self, other):
+    """Adds the current rows of a source archive's table.
+
+    Args:
+        other: The ChatTable of a source archive.
+    """
+    source = len(self.source_paths)
+    self.source_paths.append(other.source_paths[0])
+    for chat, row in other._rows.items(): # pylint: disable=protected-access
+      self._rows[chat] = len(self.dates)
+      self.dates.append(other.dates[row])
+      self.sizes.append(other.sizes[row])
+      self.participants.append(self.participant_id(
+          other.participant_names[other.participants[row]]))
+      self.sources.append(source)
+      self.live.append(1)
+
+  def group(self, keys, count, source=None):
+    """Totals chats and bytes of live rows per key.
+
+    Args:
+        keys: An array of non-negative integer keys, one per row.
+        count: The number of distinct keys.
+        source: The id of the archive to total; None to total all of them.
+
+    Returns:
+        A (chats, sizes) tuple of lists indexed by key.
+    """
+    numpy = _numpy()
+    if numpy is not None:
+      live = numpy.frombuffer(self.live, dtype=numpy.uint8) == 1
+      if source is not None:
+        live &= numpy.frombuffer(self.sources, dtype=numpy.int32) == source
+      keys = numpy.asarray(keys)[live]
+      sizes = numpy.frombuffer(self.sizes, dtype=numpy.int64)[live]
+      chats = numpy.bincount(keys, minlength=count)
+      totals = numpy.bincount(keys, weights=sizes, minlength=count)
+      return ([int(chat) for chat in chats],
+              [int(total) for total in totals])
+
+    chats, totals = [0] * count, [0] * count
+    rows = zip(keys, self.sizes, self.live, self.sources)
+    for key, size, live, row_source in rows:
+      if live and source in (None, row_source):
+        chats[key] += 1
+        totals[key] += size
+    return chats, totals
+
+  def by_month(self, source=None):
+    """Totals chats and bytes per month.
+
+    Args:
+        source: The id of the archive to total; None to total all of them.
+
+    Returns:
+        A sorted list of ("YYYY-MM", chats, bytes) tuples for months with
+        chats.
+    """
+    if not self.dates:
+      return []
+
+    numpy = _numpy()
+
+    if numpy is not None:
+      ordinals, keys = numpy.unique(numpy.frombuffer(self.dates, numpy.int32),
+                                    return_inverse=True)
+      ordinals = ordinals.tolist()
+    else:
+      ordinals = sorted(set(self.dates))
+      position = {ordinal: index for index, ordinal in enumerate(ordinals)}
+      keys = array("i", (position[ordinal] for ordinal in self.dates))
+
+    months = sorted({date.fromordinal(o).strftime("%Y-%m") for o in ordinals})
+    month_ids = {month: index for index, month in enumerate(months)}
+    day_months = [month_ids[date.fromordinal(o).strftime("%Y-%m")]
+                  for o in ordinals]
+    if numpy is not None:
+      keys = numpy.asarray(day_months)[keys]
+    else:
+      keys = array("i", (day_months[key] for key in keys))
+
+    chats, totals = self.group(keys, len(months), source)
+    return [row for row in zip(months, chats, totals) if row[1]]
+
+  def by_participant(self, source=None):
+    """Totals chats and bytes per participant.
+
+    Args:
+        source: The id of the archive to total; None to total all of them.
+
+    Returns:
+        A list of (name, chats, bytes) tuples, most chats first.
+    """
+    chats, totals = self.group(self.participants, len(self.participant_names),
+                               source)
+    rows = zip(self.participant_names, chats, totals)
+    return sorted((row for row in rows if row[1]), key=lambda r: (-r[1], r[0]))
+
+  def by_source(self):
+    """Totals chats and bytes per source archive.
+
+    Returns:
+        A list of (Path, chats, bytes) tuples in source order.
+    """
+    chats, totals = self.group(self.sources, len(self.source_paths))
+    return list(zip(self.source_paths, chats, totals))
@@ -4,8 +4,10 @@ Creates colored text and helps write Messages output.
 """
 
 from contextlib import contextmanager
+import functools
 import itertools
-import readline
+import shutil
+import sys
 
 FG_COLORS = dict(itertools.chain(
     zip(("black",
@@ -41,17 +43,22 @@ ATTRIBUTES = dict(
          "strikethrough",
         ), range(1, 10)))
 
-def colored(text, color=None, on_color=None, attrs=None, escape=False):
-  """Wraps text with ANSI escape codes to achieve the desired look.
+PAGER_PROMPT = "--More-- (enter for next page, q to quit) "
+
+@functools.lru_cache(maxsize=None)
+def style(color=None, on_color=None, attrs=(), escape=False):
+  """Builds the ANSI escape codes that surround styled text.
+
+  Results are cached, so each distinct style is assembled only once.
 
   Args:
       color: The foreground color.
       on_color: The background color.
-      attrs: A list of effects.
+      attrs: A tuple of effects.
       escape: True to escape invisibles (for readline); else False.
 
   Returns:
-      A string with the original text wrapped by escape codes.
+      A (start, end) tuple of escape code strings.
   """
   def sgr(*codes):
     return "\x1b[%sm" % ";".join(map(str, codes))
@@ -63,18 +70,114 @@ def colored(text, color=None, on_color=None, attrs=None, escape=False):
     codes.append(FG_COLORS[color])
   if on_color:
     codes.append(BG_COLORS[on_color])
-  if attrs:
-    codes.extend(ATTRIBUTES[attr] for attr in attrs)
+  codes.extend(ATTRIBUTES[attr] for attr in attrs)
 
   if not escape:
     esc = lambda n: n
 
-  return "%s%s%s" % (esc(sgr(*codes)), text, esc(sgr(0)))
+  return esc(sgr(*codes)), esc(sgr(0))
+
+def colored(text, color=None, on_color=None, attrs=None, escape=False):
+  """Wraps text with ANSI escape codes to achieve the desired look.
+
+  Args:
+      color: The foreground color.
+      on_color: The background color.
+      attrs: A list of effects.
+      escape: True to escape invisibles (for readline); else False.
+
+  Returns:
+      A string with the original text wrapped by escape codes.
+  """
+  start, end = style(color, on_color, tuple(attrs or ()), escape)
+  return "%s%s%s" % (start, text, end)
+
+class Writer:
+  """Buffers output lines and writes them in large chunks.
+
+  Usable as a context manager that flushes on exit.
+  """
+  def __init__(self, stream=None, size=256):
+    """Creates a Writer instance.
+
+    Args:
+        stream: A file object to write; sys.stdout if None.
+        size: The number of lines to buffer before writing.
+    """
+    self.stream = stream or sys.stdout
+    self.size = size
+    self._lines = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *_):
+    self.flush()
+
+  def __call__(self, text=None):
+    """Buffers one line of output.
+
+    Args:
+        text: A string to write; None for an empty line.
+    """
+    self._lines.append(text or "")
+    if len(self._lines) >= self.size:
+      self.flush()
+
+  def flush(self):
+    """Writes all buffered lines.
+    """
+    if self._lines:
+      self._lines.append("")
+      self.stream.write("\n".join(self._lines))
+      self._lines = []
+    self.stream.flush()
+
+def page(lines, height=None):
+  """Writes lines one screen at a time.
+
+  Lines are pulled from the iterable only as pages are shown, so a generator
+  formats nothing past the last page the user views. Output that is not a
+  terminal is written in full.
+
+  Args:
+      lines: An iterable of strings, one per line.
+      height: The number of lines per page; the terminal height if None.
+  """
+  lines = iter(lines)
+  if not sys.stdout.isatty():
+    with Writer() as out:
+      for line in lines:
+        out(line)
+    return
+
+  height = max((height or shutil.get_terminal_size().lines) - 1, 1)
+  end = object()
+  line = next(lines, end)
+  while line is not end:
+    with Writer() as out:
+      out(line)
+      for line in itertools.islice(lines, height - 1):
+        out(line)
+    line = next(lines, end)
+    if line is end:
+      return
+
+    with readline_disabled():
+      try:
+        reply = input(PAGER_PROMPT).casefold()
+      except (EOFError, KeyboardInterrupt):
+        print()
+        reply = "q"
+    if reply.startswith("q"):
+      return
 
 @contextmanager
 def readline_disabled():
   """Context manager to temporarily disable readline features.
   """
+  import readline # pylint: disable=import-outside-toplevel
+
   readline.set_auto_history(False)
   try:
     yield
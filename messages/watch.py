@@ -0,0 +1,206 @@
+"""Watchers for changes to message archives on disk.
+
+Reports created, removed and modified paths under archive roots, through
+inotify on Linux or by polling elsewhere.
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+import threading
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+IN_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+           IN_CREATE | IN_DELETE)
+IN_EVENT = struct.Struct("iIII")
+
+class Watcher(abc.ABC):
+  """Base class for watching archive roots on a background thread.
+
+  Attributes:
+      roots: A list of Path objects being watched.
+      changed: Function called as changed(path) for each changed path.
+      count: The number of changes reported so far.
+      error: The exception that stopped the watcher, or None.
+  """
+  def __init__(self, changed, interval=1.0):
+    """Creates a Watcher instance.
+
+    Args:
+        changed: Function called as changed(path) for each changed path.
+        interval: Seconds between checks for stopping or polling.
+    """
+    self.roots = []
+    self.changed = changed
+    self.count = 0
+    self.error = None
+    self.interval = interval
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+
+  def _run(self):
+    try:
+      while not self._stop.is_set():
+        for path in sorted(self.poll()):
+          self.count += 1
+          try:
+            self.changed(path)
+          except OSError:
+            # Changed again while being applied; a later event catches up.
+            pass
+    except Exception as ex: # pylint: disable=broad-except
+      self.error = ex
+
+  def add(self, root):
+    """Starts watching an archive root.
+
+    Args:
+        root: Path object to the archive root.
+    """
+    self.roots.append(root)
+
+  @abc.abstractmethod
+  def poll(self):
+    """Waits up to the interval for changes.
+
+    Returns:
+        A set of changed Path objects.
+    """
+
+  def start(self):
+    """Starts reporting changes.
+    """
+    self._thread.start()
+
+  def stop(self):
+    """Stops reporting changes and waits for the watcher to finish.
+    """
+    self._stop.set()
+    self._thread.join()
+
+class PollingWatcher(Watcher):
+  """Watches archive roots by comparing file stats between scans.
+  """
+  def __init__(self, changed, interval=1.0):
+    super().__init__(changed, interval)
+    self._stats = {}
+
+  @staticmethod
+  def scan(root):
+    """Records the modification time and size of everything under root.
+
+    Args:
+        root: Path object to the archive root.
+
+    Returns:
+        A {Path: (mtime, size)} dictionary.
+    """
+    stats = {}
+    for directory, _, files in os.walk(root):
+      for name in files:
+        path = Path(directory, name)
+        try:
+          statinfo = path.stat()
+        except OSError:
+          continue
+        stats[path] = (statinfo.st_mtime_ns, statinfo.st_size)
+    return stats
+
+  def add(self, root):
+    self._stats[root] = self.scan(root)
+    super().add(root)
+
+  def poll(self):
+    self._stop.wait(self.interval)
+    changed = set()
+    for root in list(self.roots):
+      stats = self.scan(root)
+      old = self._stats[root]
+      changed.update(path for path in stats.keys() ^ old.keys())
+      changed.update(path for path in stats.keys() & old.keys()
+                     if stats[path] != old[path])
+      self._stats[root] = stats
+    return changed
+
+class InotifyWatcher(Watcher):
+  """Watches archive roots through Linux inotify.
+  """
+  def __init__(self, changed, interval=1.0):
+    super().__init__(changed, interval)
+    self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    self._watches = {}
+
+  def _watch(self, path):
+    for directory, _, _ in os.walk(path):
+      wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory),
+                                        IN_MASK)
+      if wd >= 0:
+        self._watches[wd] = Path(directory)
+
+  def add(self, root):
+    super().add(root)
+    self._watch(root)
+
+  def poll(self):
+    ready, _, _ = select.select([self._fd], [], [], self.interval)
+    if not ready:
+      return set()
+
+    data = os.read(self._fd, 64 * 1024)
+    changed = set()
+    offset = 0
+    while offset < len(data):
+      wd, mask, _, length = IN_EVENT.unpack_from(data, offset)
+      offset += IN_EVENT.size
+      name = data[offset:offset + length].rstrip(b"\0")
+      offset += length
+
+      if mask & IN_Q_OVERFLOW:
+        changed.update(self.roots)
+      elif mask & IN_IGNORED:
+        self._watches.pop(wd, None)
+      elif wd in self._watches:
+        path = self._watches[wd] / os.fsdecode(name)
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+          self._watch(path)
+        changed.add(path)
+    return changed
+
+  def stop(self):
+    super().stop()
+    os.close(self._fd)
+
+def watcher(changed, interval=1.0):
+  """Creates the best watcher available on this platform.
+
+  Args:
+      changed: Function called as changed(path) for each changed path.
+      interval: Seconds between checks for stopping or polling.
+
+  Returns:
+      An InotifyWatcher on Linux; else a PollingWatcher.
+  """
+  if sys.platform.startswith("linux"):
+    try:
+      return InotifyWatcher(changed, interval)
+    except (AttributeError, OSError):
+      pass
+  return PollingWatcher(changed, interval)
@@ -21,6 +21,7 @@ setup(
     },
     python_requires="~=3.7",
     install_requires=["xattr"],
+    extras_require={"stats": ["numpy"]},
     keywords="cli macos messages chats",
     classifiers=[
         "Development Status :: 4 - Beta",
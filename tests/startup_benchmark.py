@@ -0,0 +1,97 @@
+"""Benchmarks startup time of the Messages CLI.
+
+Helper tool to catch regressions in how long short runs, such as --help
+or opening a small archive, take before doing any work.
+"""
+
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__, "../..").resolve()
+
+def measure(cli_args, runs, stdin=None):
+  """Times CLI runs in fresh interpreters.
+
+  Args:
+      cli_args: A list of arguments to pass to the CLI.
+      runs: The number of runs to time.
+      stdin: Bytes to pass to the CLI as input, or None.
+
+  Returns:
+      A list of wall-clock times in milliseconds.
+  """
+  times = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "messages", *cli_args], cwd=ROOT,
+                   input=stdin, stdout=subprocess.DEVNULL, check=True)
+    times.append((time.perf_counter() - start) * 1000)
+  return times
+
+def generate(root):
+  """Generates a small archive to open.
+
+  Args:
+      root: Path object to an empty directory for the archive.
+  """
+  for day in range(1, 11):
+    directory = root / f"2020-01-{day:02}"
+    directory.mkdir()
+    for hour in range(10):
+      chat = directory / f"Peach on 2020-01-{day:02} at {hour:02}.00.00.ichat"
+      chat.write_bytes(b"\0" * 1024)
+
+def main(budget, open_budget, runs):
+  """Main function of this helper.
+
+  Args:
+      budget: The maximum median --help time in milliseconds.
+      open_budget: The maximum median time to open a small archive in
+          milliseconds.
+      runs: The number of runs to time.
+
+  Returns:
+      0 if every median is within budget; else 1.
+  """
+  interpreter = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    interpreter.append((time.perf_counter() - start) * 1000)
+
+  with tempfile.TemporaryDirectory() as archive:
+    generate(Path(archive))
+    cases = {
+        "--help": (measure(["--help"], runs), budget),
+        "open archive": (measure([archive], runs, stdin=b"quit\n"),
+                         open_budget),
+    }
+
+  result = 0
+  for name, (times, case_budget) in cases.items():
+    median = statistics.median(times)
+    overhead = median - statistics.median(interpreter)
+    print(f"{name}: {median:.1f} ms median over {runs} runs "
+          f"({overhead:.1f} ms over a bare interpreter)")
+    if overhead > case_budget:
+      print(f"Over the startup budget of {case_budget} ms.")
+      result = 1
+  return result
+
+if __name__ == "__main__":
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Startup Benchmark.")
+  parser.add_argument("--budget", type=float, default=50,
+                      help="Allowed --help milliseconds over a bare "
+                      "interpreter")
+  parser.add_argument("--open-budget", type=float, default=150,
+                      help="Allowed milliseconds over a bare interpreter to "
+                      "open a small archive")
+  parser.add_argument("--runs", type=int, default=10, help="Runs to time")
+  args = parser.parse_args()
+  sys.exit(main(args.budget, args.open_budget, args.runs))
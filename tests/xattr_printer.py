@@ -22,8 +22,8 @@ def main(root):
   }
 
   for path in sorted(filter(lambda p: p.name not in IGN, root.glob("**/*"))):
+    xpath = xattr.xattr(path)
     for attr, store in results.items():
-      xpath = xattr.xattr(path)
       if attr in xpath:
         val = xpath.get(attr)
         if val not in store: